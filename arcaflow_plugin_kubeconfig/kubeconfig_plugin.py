@@ -1,12 +1,70 @@
 #!/usr/bin/env python3
 import base64
+import enum
+import gzip
+import hashlib
+import io
+import json
+import os
 import sys
+import tempfile
+import threading
+import time
 import traceback
 import typing
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 
+import requests
 import yaml
+import zstandard
 from arcaflow_plugin_sdk import plugin, schema, validation
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+from cryptography.hazmat.primitives import serialization
+
+DEFAULT_MAX_INPUT_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class ParserLimits:
+    """
+    These are the resource limits enforced while loading a kubeconfig in bounded
+    mode.
+    """
+
+    max_input_size: typing.Annotated[
+        int,
+        validation.min(1),
+        schema.units(schema.UNIT_CHARACTER),
+        schema.name("Maximum input size"),
+        schema.description("Maximum length of the kubeconfig input"),
+    ] = DEFAULT_MAX_INPUT_SIZE
+    max_aliases: typing.Annotated[
+        int,
+        validation.min(0),
+        schema.name("Maximum aliases"),
+        schema.description("Maximum number of YAML aliases in the document"),
+    ] = 100
+    max_alias_expansion: typing.Annotated[
+        int,
+        validation.min(0),
+        schema.name("Maximum alias expansion"),
+        schema.description(
+            "Maximum number of nodes the YAML aliases may expand to in total"
+        ),
+    ] = 10000
+    max_depth: typing.Annotated[
+        int,
+        validation.min(1),
+        schema.name("Maximum depth"),
+        schema.description("Maximum nesting depth of YAML collections"),
+    ] = 64
+    max_nodes: typing.Annotated[
+        int,
+        validation.min(1),
+        schema.name("Maximum nodes"),
+        schema.description("Maximum number of YAML nodes in the document"),
+    ] = 100000
 
 
 @dataclass
@@ -21,6 +79,140 @@ class InputParams:
             "description": "input kubeconfig string",
         }
     )
+    verify_certificates: bool = field(
+        default=False,
+        metadata={
+            "name": "Verify certificates",
+            "description": (
+                "Verify offline that the client key matches the client certificate"
+                " and that the client certificate chains to the cluster CA"
+            ),
+        },
+    )
+    limits: typing.Optional[ParserLimits] = field(
+        default=None,
+        metadata={
+            "name": "Parser limits",
+            "description": (
+                "Load the kubeconfig in bounded mode, rejecting input that exceeds"
+                " these limits while it is being parsed"
+            ),
+        },
+    )
+
+
+@dataclass
+class LintInputParams:
+    """
+    This is the input data structure for the kubeconfig lint step.
+    """
+
+    kubeconfig: typing.Annotated[
+        str,
+        validation.min(1),
+        schema.name("kubeconfig"),
+        schema.description("input kubeconfig string"),
+    ]
+
+
+DEFAULT_MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+
+class Compression(enum.Enum):
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+@dataclass
+class CompressedInputParams:
+    """
+    This is the input data structure for a base64-encoded, compressed kubeconfig.
+    """
+
+    kubeconfig: typing.Annotated[
+        str,
+        validation.min(1),
+        schema.name("Compressed kubeconfig"),
+        schema.description("Base64-encoded gzip or zstd compressed kubeconfig"),
+    ]
+    compression: typing.Annotated[
+        Compression,
+        schema.name("Compression"),
+        schema.description("Compression algorithm used on the kubeconfig"),
+    ] = Compression.GZIP
+    max_decompressed_size: typing.Annotated[
+        int,
+        validation.min(1),
+        schema.units(schema.UNIT_BYTE),
+        schema.name("Maximum decompressed size"),
+        schema.description(
+            "Maximum size of the decompressed kubeconfig. Decompression is aborted"
+            " as soon as this limit is exceeded."
+        ),
+    ] = DEFAULT_MAX_DECOMPRESSED_SIZE
+    limits: typing.Annotated[
+        typing.Optional[ParserLimits],
+        schema.name("Parser limits"),
+        schema.description(
+            "Resource limits enforced while loading the YAML; the input size is"
+            " bounded by the maximum decompressed size instead. The default"
+            " limits apply when not set."
+        ),
+    ] = None
+
+
+@dataclass
+class SecretsInputParams:
+    """
+    This is the input data structure for a YAML stream of Secrets or ConfigMaps
+    that embed kubeconfigs.
+    """
+
+    secrets: typing.Annotated[
+        str,
+        validation.min(1),
+        schema.name("Secrets"),
+        schema.description(
+            "Multi-document YAML stream of Secrets or ConfigMaps, or List objects"
+            " holding them, as produced by 'kubectl get secrets -o yaml'"
+        ),
+    ]
+    key: typing.Annotated[
+        str,
+        validation.min(1),
+        schema.name("Data key"),
+        schema.description("Key in the object data holding the kubeconfig"),
+    ] = "kubeconfig"
+    limits: typing.Annotated[
+        typing.Optional[ParserLimits],
+        schema.name("Parser limits"),
+        schema.description(
+            "Resource limits enforced on each object of the stream and each"
+            " embedded kubeconfig; the input size only applies to the latter. The"
+            " default limits apply when not set."
+        ),
+    ] = None
+
+
+DEFAULT_SERVICE_ACCOUNT_PATH = "/var/run/secrets/kubernetes.io/serviceaccount"
+
+
+@dataclass
+class InClusterInputParams:
+    """
+    This is the input data structure for building a connection from the service
+    account mounted into the pod the plugin runs in.
+    """
+
+    service_account_path: typing.Annotated[
+        str,
+        validation.min(1),
+        schema.name("Service account path"),
+        schema.description(
+            "Directory holding the mounted service account 'token' and 'ca.crt'"
+            " files"
+        ),
+    ] = DEFAULT_SERVICE_ACCOUNT_PATH
 
 
 @dataclass
@@ -76,6 +268,28 @@ class Connection:
     ] = None
 
 
+@dataclass
+class ConnectionFingerprint:
+    """
+    This is a stable content fingerprint of a connection, usable as an ETag.
+    """
+
+    sha256: typing.Annotated[
+        str,
+        schema.name("SHA-256"),
+        schema.description(
+            "Hex SHA-256 digest over a canonical JSON encoding of the connection"
+        ),
+    ]
+    fields: typing.Annotated[
+        typing.Dict[str, str],
+        schema.name("Field hashes"),
+        schema.description(
+            "Hex SHA-256 digest of each connection field that is set, by field name"
+        ),
+    ]
+
+
 @dataclass
 class SuccessOutput:
     """
@@ -87,6 +301,109 @@ class SuccessOutput:
         schema.name("Kubernetes connection"),
         schema.description("Kubernetes connection confirmation."),
     ]
+    fingerprint: typing.Annotated[
+        typing.Optional[ConnectionFingerprint],
+        schema.name("Fingerprint"),
+        schema.description(
+            "Content fingerprint of the connection, identical whenever the extracted"
+            " credentials are identical"
+        ),
+    ] = None
+
+
+@dataclass
+class SecretConnection:
+    """
+    This is the connection extracted from a single Secret or ConfigMap.
+    """
+
+    name: typing.Annotated[
+        str,
+        schema.name("Name"),
+        schema.description("Name of the Secret or ConfigMap"),
+    ]
+    connection: typing.Annotated[
+        Connection,
+        schema.name("Kubernetes connection"),
+        schema.description("Kubernetes connection confirmation."),
+    ]
+    namespace: typing.Annotated[
+        typing.Optional[str],
+        schema.name("Namespace"),
+        schema.description("Namespace of the Secret or ConfigMap"),
+    ] = None
+    fingerprint: typing.Annotated[
+        typing.Optional[ConnectionFingerprint],
+        schema.name("Fingerprint"),
+        schema.description("Content fingerprint of the connection"),
+    ] = None
+
+
+@dataclass
+class SecretsSuccessOutput:
+    """
+    This is the output data structure for the success case of the secrets step.
+    """
+
+    connections: typing.Annotated[
+        typing.List[SecretConnection],
+        schema.name("Kubernetes connections"),
+        schema.description("One connection per Secret or ConfigMap, in stream order"),
+    ]
+
+
+class Severity(enum.Enum):
+    ERROR = "error"
+    WARNING = "warning"
+
+
+@dataclass
+class LintProblem:
+    """
+    This is a single problem found in a kubeconfig.
+    """
+
+    severity: typing.Annotated[
+        Severity,
+        schema.name("Severity"),
+        schema.description(
+            "Errors make the kubeconfig unusable or ambiguous, warnings flag entries"
+            " that are unused, unsupported or outside the current context"
+        ),
+    ]
+    path: typing.Annotated[
+        str,
+        schema.name("Path"),
+        schema.description("Path of the offending node, for example $.users[0].user"),
+    ]
+    line: typing.Annotated[
+        int,
+        schema.name("Line"),
+        schema.description("Line number of the offending node, starting at 1"),
+    ]
+    message: typing.Annotated[
+        str,
+        schema.name("Message"),
+        schema.description("Description of the problem"),
+    ]
+
+
+@dataclass
+class LintOutput:
+    """
+    This is the output data structure of the lint step.
+    """
+
+    valid: typing.Annotated[
+        bool,
+        schema.name("Valid"),
+        schema.description("True if no errors were found"),
+    ]
+    problems: typing.Annotated[
+        typing.List[LintProblem],
+        schema.name("Problems"),
+        schema.description("Every error and warning found, in document order"),
+    ]
 
 
 @dataclass
@@ -107,28 +424,15 @@ kubeconfig_input_schema = plugin.build_object_schema(InputParams)
 kubeconfig_output_schema = plugin.build_object_schema(SuccessOutput)
 
 
-@plugin.step(
-    id="kubeconfig",
-    name="kubeconfig plugin",
-    description=(
-        "Inputs a kubeconfig, parses it and extracts the kubernetes cluster details"
-    ),
-    outputs={"success": SuccessOutput, "error": ErrorOutput},
-)
-def extract_kubeconfig(
-    params: InputParams,
+def parse_kubeconfig(
+    kubeconfig: typing.Any,
+    verify_certificates: bool = False,
 ) -> typing.Tuple[str, typing.Union[SuccessOutput, ErrorOutput]]:
-    print("==>> Parsing and extracting kubernetes cluster details ...")
-
+    """
+    Extracts the connection details of the current context from an already
+    loaded kubeconfig document, optionally verifying the client certificate.
+    """
     try:
-        try:
-            kubeconfig = yaml.safe_load(params.kubeconfig)
-        except Exception as e:
-            return "error", ErrorOutput(
-                "Exception occurred while loading YAML. Input is not valid YAML."
-                f" Exception: {e}"
-            )
-
         # Kubeconfig files have the kind set as Config
         try:
             kind = kubeconfig["kind"]
@@ -246,6 +550,31 @@ def extract_kubeconfig(
         output.connection.password = user.get("password", None)
         output.connection.bearerToken = user.get("token", None)
 
+        auth_provider = user.get("auth-provider", None)
+        if (
+            output.connection.bearerToken is None
+            and auth_provider is not None
+            and auth_provider.get("name", None) == "oidc"
+        ):
+            try:
+                output.connection.bearerToken = oidc_token(
+                    auth_provider.get("config", None) or {}
+                )
+            except OIDCError as e:
+                return "error", ErrorOutput(
+                    f"Failed to get an OIDC token for user {current_user}: {e}"
+                )
+
+        if verify_certificates:
+            error = verify_client_certificate(
+                output.connection.cert,
+                output.connection.key,
+                output.connection.cacert,
+            )
+            if error is not None:
+                return "error", ErrorOutput(error)
+
+        output.fingerprint = fingerprint_connection(output.connection)
         return "success", output
     except Exception as e:
         # This is the catch-all case.
@@ -256,6 +585,1130 @@ def extract_kubeconfig(
         )
 
 
+@plugin.step(
+    id="kubeconfig",
+    name="kubeconfig plugin",
+    description=(
+        "Inputs a kubeconfig, parses it and extracts the kubernetes cluster details"
+    ),
+    outputs={"success": SuccessOutput, "error": ErrorOutput},
+)
+def extract_kubeconfig(
+    params: InputParams,
+) -> typing.Tuple[str, typing.Union[SuccessOutput, ErrorOutput]]:
+    print("==>> Parsing and extracting kubernetes cluster details ...")
+
+    try:
+        if params.limits is not None:
+            kubeconfig = bounded_safe_load(params.kubeconfig, params.limits)
+        else:
+            kubeconfig = yaml.safe_load(params.kubeconfig)
+    except ParserLimitExceeded as e:
+        return "error", ErrorOutput(f"Refusing to load kubeconfig: {e}")
+    except Exception as e:
+        return "error", ErrorOutput(
+            "Exception occurred while loading YAML. Input is not valid YAML."
+            f" Exception: {e}"
+        )
+    return parse_kubeconfig(kubeconfig, params.verify_certificates)
+
+
+class ParserLimitExceeded(Exception):
+    """
+    Raised when a kubeconfig exceeds one of the configured ParserLimits.
+    """
+
+
+class _BoundedLoader(yaml.SafeLoader):
+    """
+    SafeLoader that enforces ParserLimits while composing the node graph, before
+    any Python objects are constructed. Aliases are charged the full size of
+    the node they refer to, so nested alias structures are caught as they grow.
+    """
+
+    def __init__(self, stream: str, limits: ParserLimits):
+        super().__init__(stream)
+        self._limits = limits
+        self._depth = 0
+        self._nodes = 0
+        self._aliases = 0
+        self._alias_expansion = 0
+        self._expanded = 0
+        self._anchor_sizes: typing.Dict[int, int] = {}
+
+    def _reset_limits(self, anchors: bool):
+        """
+        Starts charging the node and alias limits afresh, for loaders that
+        apply them to each object of a stream. Anchor sizes are only forgotten
+        along with the anchors themselves at the end of a document.
+        """
+        self._nodes = 0
+        self._aliases = 0
+        self._alias_expansion = 0
+        if anchors:
+            self._anchor_sizes = {}
+
+    def compose_node(self, parent, index):
+        if self.check_event(yaml.AliasEvent):
+            node = super().compose_node(parent, index)
+            self._aliases += 1
+            if self._aliases > self._limits.max_aliases:
+                raise ParserLimitExceeded(
+                    f"more than {self._limits.max_aliases} YAML aliases"
+                )
+            # An alias to an anchor that is still being composed is recursive;
+            # it is charged a single node.
+            size = self._anchor_sizes.get(id(node), 1)
+            self._alias_expansion += size
+            self._expanded += size
+            if self._alias_expansion > self._limits.max_alias_expansion:
+                raise ParserLimitExceeded(
+                    "YAML aliases expand to more than"
+                    f" {self._limits.max_alias_expansion} nodes"
+                )
+            return node
+
+        self._depth += 1
+        self._nodes += 1
+        self._expanded += 1
+        if self._depth > self._limits.max_depth:
+            raise ParserLimitExceeded(
+                f"YAML nesting deeper than {self._limits.max_depth} levels"
+            )
+        if self._nodes > self._limits.max_nodes:
+            raise ParserLimitExceeded(f"more than {self._limits.max_nodes} YAML nodes")
+        anchor = self.peek_event().anchor
+        start = self._expanded
+        node = super().compose_node(parent, index)
+        if anchor is not None:
+            self._anchor_sizes[id(node)] = self._expanded - start + 1
+        self._depth -= 1
+        return node
+
+
+def bounded_safe_load(
+    stream: typing.Union[str, typing.TextIO], limits: ParserLimits
+) -> typing.Any:
+    """
+    Equivalent of yaml.safe_load that raises ParserLimitExceeded as soon as the
+    input exceeds one of the given limits. The input size is only checked for
+    strings; the length of a stream has to be bounded by its reader.
+    """
+    if isinstance(stream, str) and len(stream) > limits.max_input_size:
+        raise ParserLimitExceeded(
+            f"input is longer than {limits.max_input_size} characters"
+        )
+    loader = _BoundedLoader(stream, limits)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
+
+
+class DecompressedSizeExceeded(Exception):
+    """
+    Raised when a compressed kubeconfig inflates beyond the configured limit.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return f"decompressed kubeconfig exceeds the limit of {self.limit} bytes"
+
+
+class _BoundedReader(io.RawIOBase):
+    """
+    Wraps a decompressing reader and aborts once more than ``limit`` bytes have
+    been produced, so the limit holds without inflating the whole input first.
+    """
+
+    def __init__(self, source: typing.BinaryIO, limit: int):
+        self._source = source
+        self._limit = limit
+        self._total = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        read = self._source.readinto(buffer)
+        self._total += read
+        if self._total > self._limit:
+            raise DecompressedSizeExceeded(self._limit)
+        return read
+
+
+@plugin.step(
+    id="kubeconfig_compressed",
+    name="compressed kubeconfig plugin",
+    description=(
+        "Inputs a base64-encoded gzip or zstd compressed kubeconfig, decompresses"
+        " and parses it and extracts the kubernetes cluster details"
+    ),
+    outputs={"success": SuccessOutput, "error": ErrorOutput},
+)
+def extract_compressed_kubeconfig(
+    params: CompressedInputParams,
+) -> typing.Tuple[str, typing.Union[SuccessOutput, ErrorOutput]]:
+    print("==>> Decompressing, parsing and extracting kubernetes cluster details ...")
+
+    try:
+        compressed = io.BytesIO(base64.b64decode(params.kubeconfig, validate=True))
+    except Exception as e:
+        return "error", ErrorOutput(
+            f"Failed to decode the compressed kubeconfig as base64. Exception: {e}"
+        )
+
+    if params.compression == Compression.ZSTD:
+        source = zstandard.ZstdDecompressor().stream_reader(compressed)
+    else:
+        source = gzip.GzipFile(fileobj=compressed, mode="rb")
+
+    # The YAML loader pulls from the decompressor in chunks, so the full
+    # decompressed document is never materialized separately from the parse.
+    stream = io.TextIOWrapper(
+        io.BufferedReader(_BoundedReader(source, params.max_decompressed_size)),
+        encoding="utf-8",
+    )
+    try:
+        kubeconfig = bounded_safe_load(stream, params.limits or ParserLimits())
+    except (DecompressedSizeExceeded, ParserLimitExceeded) as e:
+        return "error", ErrorOutput(f"Refusing to load kubeconfig: {e}")
+    except UnicodeDecodeError as e:
+        return "error", ErrorOutput(
+            f"The decompressed kubeconfig is not valid UTF-8. Exception: {e}"
+        )
+    except yaml.YAMLError as e:
+        return "error", ErrorOutput(
+            "Exception occurred while loading YAML. Input is not valid YAML."
+            f" Exception: {e}"
+        )
+    except Exception as e:
+        return "error", ErrorOutput(
+            f"Failed to decompress the kubeconfig using {params.compression.value}."
+            f" Exception: {e}"
+        )
+    finally:
+        source.close()
+    if kubeconfig is None:
+        return "error", ErrorOutput("The decompressed kubeconfig is empty.")
+    return parse_kubeconfig(kubeconfig)
+
+
+class _Item(typing.NamedTuple):
+    """
+    An item of a top-level mapping whose kind was not known yet when the item
+    was read. It only counts as an object if the mapping turns out to be a List.
+    """
+
+    value: typing.Any
+
+
+class _ItemsEnd(typing.NamedTuple):
+    """
+    Follows the _Item objects of a mapping and tells whether it was a List.
+    """
+
+    is_list: bool
+
+
+def _is_list_kind(kind: typing.Any) -> bool:
+    return isinstance(kind, str) and kind.endswith("List")
+
+
+class _ObjectStreamLoader(_BoundedLoader):
+    """
+    Bounded loader that yields the objects of a multi-document stream one at a
+    time. The 'items' of top-level mappings such as List, SecretList or
+    ConfigMapList are composed and constructed item by item, so a single large
+    List does not have to be held in memory as a whole. The node and alias
+    limits apply to each document and to each item on its own.
+    """
+
+    def _construct_next(self) -> typing.Any:
+        return self.construct_document(self.compose_node(None, None))
+
+    def _iter_mapping(self) -> typing.Iterator[typing.Any]:
+        self.get_event()
+        document = {}
+        tentative = False
+        while not self.check_event(yaml.MappingEndEvent):
+            key = self._construct_next()
+            kind_known = "kind" in document
+            if (
+                key == "items"
+                and self.check_event(yaml.SequenceStartEvent)
+                and (not kind_known or _is_list_kind(document["kind"]))
+            ):
+                self.get_event()
+                while not self.check_event(yaml.SequenceEndEvent):
+                    self._reset_limits(anchors=False)
+                    item = self._construct_next()
+                    yield item if kind_known else _Item(item)
+                self.get_event()
+                tentative = tentative or not kind_known
+            else:
+                document[key] = self._construct_next()
+        self.get_event()
+        # The kind of a List may follow its items, as in the output of kubectl,
+        # so items read before the kind are only confirmed here.
+        is_list = _is_list_kind(document.get("kind"))
+        if tentative:
+            yield _ItemsEnd(is_list)
+        if not is_list:
+            yield document
+
+    def iter_objects(self) -> typing.Iterator[typing.Any]:
+        self.get_event()
+        while not self.check_event(yaml.StreamEndEvent):
+            self.get_event()
+            if self.check_event(yaml.MappingStartEvent):
+                yield from self._iter_mapping()
+            else:
+                yield self._construct_next()
+            self.get_event()
+            self.anchors = {}
+            self._reset_limits(anchors=True)
+        self.get_event()
+
+
+def _iter_objects(stream: str, limits: ParserLimits) -> typing.Iterator[typing.Any]:
+    loader = _ObjectStreamLoader(stream, limits)
+    try:
+        yield from loader.iter_objects()
+    finally:
+        loader.dispose()
+
+
+def _secret_connection(
+    obj: typing.Any, key: str, limits: ParserLimits
+) -> typing.Optional[typing.Tuple[str, typing.Union[SecretConnection, ErrorOutput]]]:
+    """
+    Extracts the connection of the kubeconfig embedded under the given data key
+    of a Secret or ConfigMap. Returns None for any other object, or when the key
+    is not set.
+    """
+    if not isinstance(obj, dict):
+        return None
+    kind = obj.get("kind")
+    if kind not in ("Secret", "ConfigMap"):
+        return None
+    metadata = obj.get("metadata") or {}
+    data = obj.get("data") or {}
+    string_data = obj.get("stringData") or {}
+    for field_name, value in [
+        ("metadata", metadata),
+        ("data", data),
+        ("stringData", string_data),
+    ]:
+        if not isinstance(value, dict):
+            return "error", ErrorOutput(
+                f"Invalid {kind} in the input: '{field_name}' must be a mapping,"
+                f" got {type(value).__name__}"
+            )
+    name = metadata.get("name", "")
+    namespace = metadata.get("namespace")
+    for field_name, value in [("name", name), ("namespace", namespace)]:
+        if value is not None and not isinstance(value, str):
+            return "error", ErrorOutput(
+                f"Invalid {kind} in the input: 'metadata.{field_name}' must be a"
+                f" string, got {type(value).__name__}"
+            )
+    if kind == "Secret":
+        if key in string_data:
+            embedded = string_data[key]
+        elif key in data:
+            try:
+                embedded = base64.b64decode(data[key]).decode("utf-8")
+            except Exception as e:
+                return "error", ErrorOutput(
+                    f"Failed to decode '{key}' of Secret {name}. Exception: {e}"
+                )
+        else:
+            return None
+    else:
+        if key not in data:
+            return None
+        embedded = data[key]
+
+    try:
+        kubeconfig = bounded_safe_load(embedded, limits)
+    except ParserLimitExceeded as e:
+        return "error", ErrorOutput(
+            f"Refusing to load the kubeconfig in {kind} {name}: {e}"
+        )
+    except Exception as e:
+        return "error", ErrorOutput(
+            f"The kubeconfig in {kind} {name} is not valid YAML. Exception: {e}"
+        )
+    result, output = parse_kubeconfig(kubeconfig)
+    if result != "success":
+        return "error", ErrorOutput(f"{kind} {name}: {output.error}")
+    return "success", SecretConnection(
+        name=name,
+        namespace=namespace,
+        connection=output.connection,
+        fingerprint=output.fingerprint,
+    )
+
+
+@plugin.step(
+    id="kubeconfig_secrets",
+    name="kubeconfig secrets plugin",
+    description=(
+        "Inputs a YAML stream of Secrets or ConfigMaps embedding kubeconfigs and"
+        " extracts the kubernetes cluster details of each of them"
+    ),
+    outputs={"success": SecretsSuccessOutput, "error": ErrorOutput},
+)
+def extract_secrets_kubeconfigs(
+    params: SecretsInputParams,
+) -> typing.Tuple[str, typing.Union[SecretsSuccessOutput, ErrorOutput]]:
+    print("==>> Parsing and extracting kubernetes cluster details from secrets ...")
+
+    connections = []
+    # Objects are loaded one at a time, including the items of List objects,
+    # so only the object being processed is held in memory besides the
+    # extracted connections. Items read before the kind of their mapping only
+    # count once it turns out to be a List, so their results are held back.
+    pending: typing.List[typing.Any] = []
+    limits = params.limits or ParserLimits()
+    objects = _iter_objects(params.secrets, limits)
+    while True:
+        try:
+            obj = next(objects)
+        except StopIteration:
+            break
+        except ParserLimitExceeded as e:
+            return "error", ErrorOutput(f"Refusing to load the input: {e}")
+        except Exception as e:
+            return "error", ErrorOutput(
+                "Exception occurred while loading YAML. Input is not valid YAML."
+                f" Exception: {e}"
+            )
+        if isinstance(obj, _ItemsEnd):
+            results = pending if obj.is_list else []
+            pending = []
+        elif isinstance(obj, _Item):
+            found = _secret_connection(obj.value, params.key, limits)
+            if found is not None:
+                pending.append(found)
+            continue
+        else:
+            results = [_secret_connection(obj, params.key, limits)]
+        for found in results:
+            if found is None:
+                continue
+            result, output = found
+            if result != "success":
+                return result, output
+            connections.append(output)
+
+    if len(connections) == 0:
+        return "error", ErrorOutput(
+            f"No Secret or ConfigMap with a '{params.key}' key found in the input."
+        )
+    return "success", SecretsSuccessOutput(connections)
+
+
+def _scalar(node: typing.Optional[yaml.Node]) -> typing.Optional[str]:
+    """
+    Returns the value of a non-null scalar node, or None.
+    """
+    if not isinstance(node, yaml.ScalarNode) or node.tag == "tag:yaml.org,2002:null":
+        return None
+    return node.value
+
+
+class _KubeconfigLinter:
+    """
+    Walks a composed kubeconfig node graph once and collects every structural
+    problem. References between contexts, clusters and users are resolved
+    through name indexes built during the walk, so the cost stays linear in the
+    size of the document.
+    """
+
+    def __init__(self):
+        self.problems: typing.List[LintProblem] = []
+
+    def _report(self, severity: Severity, node: yaml.Node, path: str, message: str):
+        self.problems.append(
+            LintProblem(
+                severity=severity,
+                path=path,
+                line=node.start_mark.line + 1,
+                message=message,
+            )
+        )
+
+    def _error(self, node: yaml.Node, path: str, message: str):
+        self._report(Severity.ERROR, node, path, message)
+
+    def _warning(self, node: yaml.Node, path: str, message: str):
+        self._report(Severity.WARNING, node, path, message)
+
+    def _mapping(
+        self, node: yaml.Node, path: str
+    ) -> typing.Optional[typing.Dict[str, yaml.Node]]:
+        if not isinstance(node, yaml.MappingNode):
+            self._error(node, path, "expected a mapping")
+            return None
+        entries = {}
+        for key, value in node.value:
+            if not isinstance(key, yaml.ScalarNode):
+                self._error(key, path, "mapping keys must be strings")
+                continue
+            name = _scalar(key)
+            if name in entries:
+                self._error(key, f"{path}.{name}", f"duplicate key '{name}'")
+            entries[name] = value
+        return entries
+
+    def _named_list(
+        self,
+        root: yaml.Node,
+        document: typing.Dict[str, yaml.Node],
+        field: str,
+        section: str,
+    ) -> typing.List[
+        typing.Tuple[str, str, typing.Optional[typing.Dict[str, yaml.Node]], yaml.Node]
+    ]:
+        """
+        Validates a list of named entries such as 'clusters' and returns the
+        name, path, section body and section node of every entry that has a
+        name. The body is None when the section is missing or malformed, so the
+        entry still resolves references without being linted any further.
+        """
+        path = f"$.{field}"
+        node = document.get(field)
+        if node is None:
+            self._error(root, path, f"'{field}' section missing")
+            return []
+        if not isinstance(node, yaml.SequenceNode):
+            self._error(node, path, "expected a list")
+            return []
+        entries = []
+        first_lines: typing.Dict[str, int] = {}
+        for index, entry in enumerate(node.value):
+            entry_path = f"{path}[{index}]"
+            entry_map = self._mapping(entry, entry_path)
+            if entry_map is None:
+                continue
+            name = _scalar(entry_map.get("name"))
+            if name is None:
+                self._error(entry, entry_path, "'name' field missing")
+            elif name in first_lines:
+                self._error(
+                    entry_map["name"],
+                    f"{entry_path}.name",
+                    f"duplicate {section} name '{name}', first defined on line"
+                    f" {first_lines[name]}; the last definition is used",
+                )
+            else:
+                first_lines[name] = entry_map["name"].start_mark.line + 1
+            body_path = f"{entry_path}.{section}"
+            if section not in entry_map:
+                self._error(entry, entry_path, f"'{section}' section missing")
+                body, body_node = None, entry
+            else:
+                body_node = entry_map[section]
+                body = self._mapping(body_node, body_path)
+            if name is not None:
+                entries.append((name, body_path, body, body_node))
+        return entries
+
+    def _base64_field(self, body: typing.Dict[str, yaml.Node], path: str, key: str):
+        node = body.get(key)
+        if node is None:
+            return
+        if not isinstance(node, yaml.ScalarNode):
+            self._error(node, f"{path}.{key}", f"'{key}' must be a string")
+            return
+        value = _scalar(node)
+        if value is None:
+            return
+        # Unlike base64_decode, reject characters outside the base64 alphabet
+        # instead of skipping them; only line breaks are tolerated.
+        try:
+            base64.b64decode(value.replace("\n", "").replace("\r", ""), validate=True)
+        except Exception:
+            self._error(node, f"{path}.{key}", f"'{key}' is not valid base64 data")
+
+    def _unsupported_file_fields(
+        self, body: typing.Dict[str, yaml.Node], path: str, keys: typing.List[str]
+    ):
+        for key in keys:
+            if key in body:
+                self._warning(
+                    body[key],
+                    f"{path}.{key}",
+                    f"'{key}' refers to a file, which this plugin does not read",
+                )
+
+    def _lint_cluster(self, path: str, body: typing.Dict[str, yaml.Node], node):
+        if _scalar(body.get("server")) is None:
+            self._error(node, path, "'server' field missing")
+        self._base64_field(body, path, "certificate-authority-data")
+        self._unsupported_file_fields(body, path, ["certificate-authority"])
+
+    def _lint_user(self, path: str, body: typing.Dict[str, yaml.Node], node):
+        self._base64_field(body, path, "client-certificate-data")
+        self._base64_field(body, path, "client-key-data")
+        self._unsupported_file_fields(
+            body, path, ["client-certificate", "client-key", "tokenFile"]
+        )
+        if ("client-certificate-data" in body) != ("client-key-data" in body):
+            self._error(
+                node,
+                path,
+                "'client-certificate-data' and 'client-key-data' must be set together",
+            )
+        oidc = False
+        if "auth-provider" in body:
+            provider = self._mapping(body["auth-provider"], f"{path}.auth-provider")
+            oidc = provider is not None and _scalar(provider.get("name")) == "oidc"
+            if provider is not None and not oidc:
+                self._warning(
+                    body["auth-provider"],
+                    f"{path}.auth-provider",
+                    "only the 'oidc' auth-provider is supported by this plugin",
+                )
+        if "exec" in body:
+            self._warning(
+                body["exec"],
+                f"{path}.exec",
+                "'exec' credentials are not supported by this plugin",
+            )
+        if not oidc and not any(
+            key in body for key in ["token", "username", "client-certificate-data"]
+        ):
+            self._warning(node, path, "no credentials supported by this plugin set")
+
+    def lint(self, root: yaml.Node):
+        document = self._mapping(root, "$")
+        if document is None:
+            return
+
+        kind = document.get("kind")
+        if kind is None:
+            self._error(root, "$", "'kind' field missing")
+        elif _scalar(kind) != "Config":
+            self._error(kind, "$.kind", "kind must be 'Config'")
+        api_version = document.get("apiVersion")
+        if api_version is None:
+            self._warning(root, "$", "'apiVersion' field missing")
+        elif _scalar(api_version) != "v1":
+            self._warning(api_version, "$.apiVersion", "apiVersion should be 'v1'")
+
+        clusters = self._named_list(root, document, "clusters", "cluster")
+        for _, path, body, node in clusters:
+            if body is not None:
+                self._lint_cluster(path, body, node)
+        users = self._named_list(root, document, "users", "user")
+        for _, path, body, node in users:
+            if body is not None:
+                self._lint_user(path, body, node)
+
+        # Like extract_kubeconfig, the last definition of a duplicate name wins.
+        cluster_names = {name: (path, node) for name, path, _, node in clusters}
+        user_names = {name: (path, node) for name, path, _, node in users}
+        used_clusters = set()
+        used_users = set()
+        current_context = _scalar(document.get("current-context"))
+        contexts = self._named_list(root, document, "contexts", "context")
+        for name, path, body, node in contexts:
+            if body is None:
+                continue
+            for key, names, used in [
+                ("cluster", cluster_names, used_clusters),
+                ("user", user_names, used_users),
+            ]:
+                reference = _scalar(body.get(key))
+                if reference is None:
+                    self._error(node, path, f"'{key}' field missing")
+                elif reference in names:
+                    used.add(reference)
+                else:
+                    # Dangling references only break extraction when the
+                    # current context uses them.
+                    self._report(
+                        (
+                            Severity.ERROR
+                            if name == current_context
+                            else Severity.WARNING
+                        ),
+                        body[key],
+                        f"{path}.{key}",
+                        f"context refers to undefined {key} '{reference}'",
+                    )
+
+        current_context_node = document.get("current-context")
+        if current_context_node is not None and not isinstance(
+            current_context_node, yaml.ScalarNode
+        ):
+            self._error(
+                current_context_node,
+                "$.current-context",
+                "'current-context' must be a string",
+            )
+        elif current_context is None:
+            self._error(root, "$", "'current-context' field missing")
+        elif current_context not in {name for name, _, _, _ in contexts}:
+            self._error(
+                document["current-context"],
+                "$.current-context",
+                f"no context named '{current_context}'",
+            )
+
+        for name, (path, node) in cluster_names.items():
+            if name not in used_clusters:
+                self._warning(
+                    node, path, f"cluster '{name}' is not used by any context"
+                )
+        for name, (path, node) in user_names.items():
+            if name not in used_users:
+                self._warning(node, path, f"user '{name}' is not used by any context")
+
+
+@plugin.step(
+    id="kubeconfig_lint",
+    name="kubeconfig lint",
+    description=(
+        "Inputs a kubeconfig and reports every structural error and warning in it"
+        " at once"
+    ),
+    outputs={"success": LintOutput, "error": ErrorOutput},
+)
+def lint_kubeconfig(
+    params: LintInputParams,
+) -> typing.Tuple[str, typing.Union[LintOutput, ErrorOutput]]:
+    print("==>> Linting kubeconfig ...")
+
+    try:
+        root = yaml.compose(params.kubeconfig, Loader=yaml.SafeLoader)
+    except Exception as e:
+        return "error", ErrorOutput(
+            "Exception occurred while loading YAML. Input is not valid YAML."
+            f" Exception: {e}"
+        )
+    if root is None:
+        return "error", ErrorOutput("The provided kubeconfig is empty.")
+
+    linter = _KubeconfigLinter()
+    linter.lint(root)
+    problems = sorted(linter.problems, key=lambda problem: problem.line)
+    return "success", LintOutput(
+        valid=not any(p.severity == Severity.ERROR for p in problems),
+        problems=problems,
+    )
+
+
+_file_cache: typing.Dict[str, typing.Tuple[int, int, str]] = {}
+_file_cache_lock = threading.Lock()
+
+
+def read_cached_file(path: str) -> str:
+    """
+    Returns the contents of a file, re-reading it only when its modification
+    time or size changed since the last read. Projected service account tokens
+    are rotated in place, so the cache must not outlive a change on disk.
+    """
+    stat = os.stat(path)
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+    if (
+        cached is not None
+        and cached[0] == stat.st_mtime_ns
+        and cached[1] == stat.st_size
+    ):
+        return cached[2]
+    with open(path, "r") as f:
+        content = f.read()
+    with _file_cache_lock:
+        _file_cache[path] = (stat.st_mtime_ns, stat.st_size, content)
+    return content
+
+
+@plugin.step(
+    id="kubeconfig_in_cluster",
+    name="in-cluster kubeconfig plugin",
+    description=(
+        "Builds the kubernetes cluster details from the service account of the pod"
+        " the plugin runs in"
+    ),
+    outputs={"success": SuccessOutput, "error": ErrorOutput},
+)
+def extract_in_cluster_config(
+    params: InClusterInputParams,
+) -> typing.Tuple[str, typing.Union[SuccessOutput, ErrorOutput]]:
+    print("==>> Extracting kubernetes cluster details from the service account ...")
+
+    host = os.environ.get("KUBERNETES_SERVICE_HOST", "")
+    port = os.environ.get("KUBERNETES_SERVICE_PORT", "")
+    if host == "" or port == "":
+        return "error", ErrorOutput(
+            "Not running inside a Kubernetes cluster: KUBERNETES_SERVICE_HOST and"
+            " KUBERNETES_SERVICE_PORT must be set."
+        )
+    if ":" in host:
+        # IPv6 addresses must be bracketed in URLs
+        host = f"[{host}]"
+
+    token_path = os.path.join(params.service_account_path, "token")
+    try:
+        token = read_cached_file(token_path).strip()
+    except OSError as e:
+        return "error", ErrorOutput(
+            f"Failed to read the service account token from {token_path}: {e}"
+        )
+    if token == "":
+        return "error", ErrorOutput(
+            f"The service account token in {token_path} is empty"
+        )
+
+    ca_path = os.path.join(params.service_account_path, "ca.crt")
+    try:
+        cacert = read_cached_file(ca_path)
+    except FileNotFoundError:
+        cacert = None
+    except OSError as e:
+        return "error", ErrorOutput(
+            f"Failed to read the service account CA certificate from {ca_path}: {e}"
+        )
+
+    connection = Connection(
+        host=f"https://{host}:{port}",
+        cacert=cacert,
+        bearerToken=token,
+    )
+    return "success", SuccessOutput(connection, fingerprint_connection(connection))
+
+
+class VerificationNotPossible(Exception):
+    """
+    Raised when a certificate or key uses an algorithm that cannot be verified
+    offline.
+    """
+
+
+_VERIFICATION_CACHE_SIZE = 256
+_verification_cache: typing.Dict[typing.Tuple[str, str, str], typing.Optional[str]] = {}
+_verification_cache_lock = threading.Lock()
+
+
+def _public_key_bytes(key) -> bytes:
+    return key.public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+
+def _signed_by(cert: x509.Certificate, issuer: x509.Certificate) -> bool:
+    if cert.issuer != issuer.subject:
+        return False
+    try:
+        cert.verify_directly_issued_by(issuer)
+    except InvalidSignature:
+        return False
+    except (ValueError, TypeError, UnsupportedAlgorithm) as e:
+        # The names match, so these mean the signature or key algorithm is not
+        # supported, not that the certificate was issued by someone else.
+        raise VerificationNotPossible(
+            f"cannot check the signature of '{cert.subject.rfc4514_string()}'"
+            f" by '{issuer.subject.rfc4514_string()}': {e}"
+        ) from e
+    return True
+
+
+def _verify_client_certificate(
+    cert: str, key: str, cacert: typing.Optional[str]
+) -> typing.Optional[str]:
+    chain = x509.load_pem_x509_certificates(cert.encode())
+    leaf = chain[0]
+    try:
+        private_key = serialization.load_pem_private_key(key.encode(), password=None)
+    except UnsupportedAlgorithm as e:
+        raise VerificationNotPossible(f"unsupported client key: {e}") from e
+    if _public_key_bytes(private_key.public_key()) != _public_key_bytes(
+        leaf.public_key()
+    ):
+        return "The client key does not match the public key of the client certificate."
+
+    if cacert is None:
+        return None
+    trusted = x509.load_pem_x509_certificates(cacert.encode())
+    intermediates = chain[1:]
+    current = leaf
+    # Every step either ends the walk or consumes one intermediate, so the walk
+    # is bounded by the chain length even for cyclic input.
+    while True:
+        if any(_signed_by(current, ca) for ca in trusted):
+            return None
+        issuer = next((c for c in intermediates if _signed_by(current, c)), None)
+        if issuer is None:
+            return (
+                "The client certificate does not chain to the cluster CA"
+                " certificate."
+            )
+        intermediates.remove(issuer)
+        current = issuer
+
+
+def verify_client_certificate(
+    cert: typing.Optional[str],
+    key: typing.Optional[str],
+    cacert: typing.Optional[str],
+) -> typing.Optional[str]:
+    """
+    Verifies offline that the client key belongs to the client certificate and
+    that the client certificate chains to the cluster CA. Returns an error
+    message, or None when the check passes or there is nothing to verify.
+    Results are cached by the SHA-256 fingerprints of the inputs.
+    """
+    if cert is None and key is None:
+        return None
+    if cert is None or key is None:
+        return (
+            "client-certificate-data and client-key-data must be set together"
+            " in the kubeconfig user."
+        )
+
+    fingerprint = tuple(
+        hashlib.sha256(value.encode()).hexdigest() if value is not None else ""
+        for value in (cert, key, cacert)
+    )
+    with _verification_cache_lock:
+        if fingerprint in _verification_cache:
+            return _verification_cache[fingerprint]
+
+    try:
+        result = _verify_client_certificate(cert, key, cacert)
+    except VerificationNotPossible as e:
+        result = f"Certificate verification is not possible: {e}"
+    except Exception as e:
+        result = f"Failed to parse the client certificate or key. Exception: {e}"
+
+    with _verification_cache_lock:
+        if len(_verification_cache) >= _VERIFICATION_CACHE_SIZE:
+            del _verification_cache[next(iter(_verification_cache))]
+        _verification_cache[fingerprint] = result
+    return result
+
+
+class OIDCError(Exception):
+    """
+    Raised when no valid OIDC token can be obtained for an auth-provider.
+    """
+
+
+_OIDC_EXPIRY_SKEW = 10
+_OIDC_TIMEOUT = 10
+# These caches live in memory for the lifetime of the plugin process only. The
+# token cache maps (issuer, client id, hash of the configured refresh token) to
+# the last id-token, its expiry and the refresh token the issuer rotated it to,
+# if any. Entries are dropped once their id-token expires, unless they hold a
+# rotated refresh token, which the configured one can no longer replace.
+_oidc_token_cache: typing.Dict[
+    typing.Tuple[str, str, str], typing.Tuple[str, float, typing.Optional[str]]
+] = {}
+_oidc_token_endpoints: typing.Dict[str, str] = {}
+# Refresh locks are counted by the callers using them and dropped by the last.
+_oidc_refresh_locks: typing.Dict[
+    typing.Tuple[str, str, str], typing.Tuple[threading.Lock, int]
+] = {}
+_oidc_cache_lock = threading.Lock()
+
+
+def _jwt_expiry(token: str) -> typing.Optional[float]:
+    """
+    Returns the 'exp' claim of a JWT without verifying its signature, or None if
+    the token cannot be decoded. The API server verifies the token; this is only
+    used to decide whether it is worth sending.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+def _oidc_token_valid(token: typing.Optional[str]) -> bool:
+    if not token:
+        return False
+    expiry = _jwt_expiry(token)
+    return expiry is not None and expiry > time.time() + _OIDC_EXPIRY_SKEW
+
+
+def _oidc_token_endpoint(issuer: str, verify: typing.Union[bool, str]) -> str:
+    with _oidc_cache_lock:
+        endpoint = _oidc_token_endpoints.get(issuer)
+    if endpoint is not None:
+        return endpoint
+    response = requests.get(
+        issuer.rstrip("/") + "/.well-known/openid-configuration",
+        timeout=_OIDC_TIMEOUT,
+        verify=verify,
+    )
+    response.raise_for_status()
+    endpoint = response.json()["token_endpoint"]
+    with _oidc_cache_lock:
+        _oidc_token_endpoints[issuer] = endpoint
+    return endpoint
+
+
+def _oidc_refresh(
+    config: typing.Dict[str, str], refresh_token: str, verify: typing.Union[bool, str]
+) -> typing.Tuple[str, str]:
+    """
+    Exchanges a refresh token for an id-token. Returns the id-token and the
+    refresh token to use next, which is the one passed in unless the issuer
+    rotated it.
+    """
+    endpoint = _oidc_token_endpoint(config["idp-issuer-url"], verify)
+    data = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+        "client_id": config["client-id"],
+    }
+    if config.get("client-secret"):
+        data["client_secret"] = config["client-secret"]
+    response = requests.post(endpoint, data=data, timeout=_OIDC_TIMEOUT, verify=verify)
+    if response.status_code != 200:
+        raise OIDCError(
+            f"token endpoint {endpoint} returned HTTP {response.status_code}:"
+            f" {response.text}"
+        )
+    body = response.json()
+    id_token = body.get("id_token")
+    if not id_token:
+        raise OIDCError(f"token endpoint {endpoint} did not return an id_token")
+    return id_token, body.get("refresh_token") or refresh_token
+
+
+def oidc_token(config: typing.Dict[str, str]) -> str:
+    """
+    Returns a usable id-token for an 'oidc' auth-provider config. The configured
+    id-token is used while it is valid; otherwise the refresh-token is exchanged
+    at the issuer's token endpoint. Refreshed tokens are cached in memory until
+    they expire, for the lifetime of the plugin process only, and concurrent
+    refreshes for the same identity share one request.
+    """
+    if _oidc_token_valid(config.get("id-token")):
+        return config["id-token"]
+    for key in ["idp-issuer-url", "client-id", "refresh-token"]:
+        if not config.get(key):
+            raise OIDCError(
+                f"the id-token is missing or expired and '{key}' is not set"
+            )
+
+    # The refresh token identifies the user, so it is part of the key to keep
+    # different users of the same client apart.
+    cache_key = (
+        config["idp-issuer-url"],
+        config["client-id"],
+        hashlib.sha256(config["refresh-token"].encode()).hexdigest(),
+    )
+    with _oidc_cache_lock:
+        refresh_lock, users = _oidc_refresh_locks.get(cache_key, (threading.Lock(), 0))
+        _oidc_refresh_locks[cache_key] = (refresh_lock, users + 1)
+    try:
+        with refresh_lock:
+            return _oidc_cached_refresh(config, cache_key)
+    finally:
+        with _oidc_cache_lock:
+            refresh_lock, users = _oidc_refresh_locks[cache_key]
+            if users == 1:
+                del _oidc_refresh_locks[cache_key]
+            else:
+                _oidc_refresh_locks[cache_key] = (refresh_lock, users - 1)
+
+
+def _prune_oidc_token_cache(now: float):
+    """
+    Drops the cache entries whose id-token expired and that hold no rotated
+    refresh token. Must be called with _oidc_cache_lock held.
+    """
+    for key, (_, expiry, rotated) in list(_oidc_token_cache.items()):
+        if rotated is None and expiry <= now + _OIDC_EXPIRY_SKEW:
+            del _oidc_token_cache[key]
+
+
+def _oidc_cached_refresh(
+    config: typing.Dict[str, str], cache_key: typing.Tuple[str, str, str]
+) -> str:
+    """
+    Returns the cached id-token for cache_key while it is valid, or refreshes
+    it. Must be called with the refresh lock of cache_key held.
+    """
+    with _oidc_cache_lock:
+        cached = _oidc_token_cache.get(cache_key)
+    if cached is not None and cached[1] > time.time() + _OIDC_EXPIRY_SKEW:
+        return cached[0]
+    refresh_token = config["refresh-token"]
+    if cached is not None and cached[2] is not None:
+        refresh_token = cached[2]
+
+    ca_file = None
+    verify: typing.Union[bool, str] = True
+    try:
+        if config.get("idp-certificate-authority-data"):
+            ca_file = tempfile.NamedTemporaryFile("w", suffix=".crt", delete=False)
+            ca_file.write(base64_decode(config["idp-certificate-authority-data"]))
+            ca_file.close()
+            verify = ca_file.name
+        elif config.get("idp-certificate-authority"):
+            verify = config["idp-certificate-authority"]
+        id_token, next_refresh_token = _oidc_refresh(config, refresh_token, verify)
+    except OIDCError:
+        raise
+    except Exception as e:
+        raise OIDCError(f"refreshing the token failed: {e}") from e
+    finally:
+        if ca_file is not None:
+            os.unlink(ca_file.name)
+
+    rotated = None
+    if next_refresh_token != config["refresh-token"]:
+        rotated = next_refresh_token
+    # An id-token without a known expiry is never reused, but the entry still
+    # keeps a rotated refresh token.
+    expiry = _jwt_expiry(id_token)
+    now = time.time()
+    with _oidc_cache_lock:
+        _prune_oidc_token_cache(now)
+        if expiry is not None or rotated is not None:
+            _oidc_token_cache[cache_key] = (
+                id_token,
+                expiry if expiry is not None else 0.0,
+                rotated,
+            )
+        else:
+            _oidc_token_cache.pop(cache_key, None)
+    return id_token
+
+
+def fingerprint_connection(connection: Connection) -> ConnectionFingerprint:
+    """
+    Computes a deterministic fingerprint of a connection. The overall digest is
+    taken over JSON with sorted keys and fixed separators, so it only changes
+    when a field value changes.
+    """
+    values = asdict(connection)
+    canonical = json.dumps(
+        values, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return ConnectionFingerprint(
+        sha256=hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        fields={
+            name: hashlib.sha256(value.encode("utf-8")).hexdigest()
+            for name, value in sorted(values.items())
+            if value is not None
+        },
+    )
+
+
 def base64_decode(encoded):
     if encoded is None:
         return None
@@ -267,6 +1720,10 @@ if __name__ == "__main__":
         plugin.run(
             plugin.build_schema(
                 extract_kubeconfig,
+                extract_compressed_kubeconfig,
+                extract_in_cluster_config,
+                extract_secrets_kubeconfigs,
+                lint_kubeconfig,
             )
         )
     )
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Compares yaml.safe_load with the bounded loader on the test kubeconfigs.
+
+Run from the repository root with:
+PYTHONPATH=arcaflow_plugin_kubeconfig python tests/benchmark_bounded_loading.py
+"""
+
+import timeit
+
+import yaml
+
+import kubeconfig_plugin
+
+ROUNDS = 100
+
+
+def get_kubeconfig_test_value(filename):
+    with open(filename, "r") as f:
+        return yaml.safe_load(f.read())["kubeconfig"]
+
+
+def main():
+    limits = kubeconfig_plugin.ParserLimits()
+    for filename in [
+        "tests/test_token.yaml",
+        "tests/test_client_cert.yaml",
+        "tests/test_client_cert_chain.yaml",
+    ]:
+        kubeconfig = get_kubeconfig_test_value(filename)
+        unbounded = min(
+            timeit.repeat(lambda: yaml.safe_load(kubeconfig), number=ROUNDS, repeat=5)
+        )
+        bounded = min(
+            timeit.repeat(
+                lambda: kubeconfig_plugin.bounded_safe_load(kubeconfig, limits),
+                number=ROUNDS,
+                repeat=5,
+            )
+        )
+        print(
+            f"{filename}: safe_load {unbounded / ROUNDS * 1e6:.1f} us,"
+            f" bounded {bounded / ROUNDS * 1e6:.1f} us,"
+            f" overhead {(bounded / unbounded - 1) * 100:+.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
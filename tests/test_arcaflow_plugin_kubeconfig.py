@@ -1,11 +1,139 @@
 #!/usr/bin/env python3
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 import yaml
+import zstandard
 import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
 from arcaflow_plugin_sdk import plugin
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.x509.oid import NameOID
 import kubeconfig_plugin
 
 
+def make_jwt(claims):
+    def encode(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+    return f"{encode({'alg': 'none'})}.{encode(claims)}.signature"
+
+
+def make_certificate(name, key, issuer_name=None, issuer_key=None, pss=False):
+    issuer_name = issuer_name or name
+    issuer_key = issuer_key or key
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)]))
+        .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer_name)]))
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.datetime(2024, 1, 1))
+        .not_valid_after(datetime.datetime(2124, 1, 1))
+    )
+    if pss:
+        cert = builder.sign(
+            issuer_key,
+            hashes.SHA256(),
+            rsa_padding=padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.DIGEST_LENGTH,
+            ),
+        )
+    else:
+        cert = builder.sign(issuer_key, hashes.SHA256())
+    return cert.public_bytes(serialization.Encoding.PEM)
+
+
+def make_key_pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+class StandInIdP(ThreadingHTTPServer):
+    """
+    Minimal OIDC issuer serving discovery and a refresh token grant.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInIdPHandler)
+        self.issuer = f"http://127.0.0.1:{self.server_address[1]}"
+        self.token_requests = 0
+        self.delay = 0.0
+        self.status = 200
+        self.lifetime = 3600
+        # When set, every refresh token is single use and replaced in the reply.
+        self.rotate = False
+        self.used_refresh_tokens = set()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInIdPHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/.well-known/openid-configuration":
+            return self.reply(404, {})
+        self.reply(
+            200,
+            {
+                "issuer": self.server.issuer,
+                "token_endpoint": self.server.issuer + "/token",
+            },
+        )
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        form = parse_qs(self.rfile.read(length).decode())
+        self.server.token_requests += 1
+        time.sleep(self.server.delay)
+        refresh_token = form["refresh_token"][0]
+        if self.server.status != 200:
+            return self.reply(self.server.status, {"error": "invalid_grant"})
+        if refresh_token in self.server.used_refresh_tokens:
+            return self.reply(400, {"error": "invalid_grant"})
+        claims = {
+            "sub": refresh_token,
+            "aud": form["client_id"][0],
+            "exp": int(time.time()) + self.server.lifetime,
+        }
+        body = {"id_token": make_jwt(claims), "token_type": "Bearer"}
+        if self.server.rotate:
+            self.server.used_refresh_tokens.add(refresh_token)
+            body["refresh_token"] = f"{refresh_token}-{self.server.token_requests}"
+        self.reply(200, body)
+
+
 class KubeconfigPluginTest(unittest.TestCase):
     @staticmethod
     def test_serialization():
@@ -303,6 +431,920 @@ lB1ZGDx/ARE=
         self.assertEqual("error", result)
         self.assertIn("Failed to find server", data.error)
 
+    def test_compressed_gzip(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_client_cert.yaml")
+        compressed = base64.b64encode(gzip.compress(kubeconfig.encode())).decode()
+        input = kubeconfig_plugin.CompressedInputParams(kubeconfig=compressed)
+        result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        self.assertEqual(data.connection.cert, self.EXPECTED_TOKEN)
+        self.assertEqual(data.connection.key, self.EXPECTED_KEY)
+
+    def test_compressed_zstd(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        compressed = zstandard.ZstdCompressor().compress(kubeconfig.encode())
+        input = kubeconfig_plugin.CompressedInputParams(
+            kubeconfig=base64.b64encode(compressed).decode(),
+            compression=kubeconfig_plugin.Compression.ZSTD,
+        )
+        result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        self.assertEqual(
+            "sha256~2Z70unz91xNLI43k7MnM_mTbIfwe1EVHuxEXDiFWM9c",
+            data.connection.bearerToken,
+        )
+
+    def test_compressed_size_limit(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        compressed = base64.b64encode(gzip.compress(kubeconfig.encode())).decode()
+        input = kubeconfig_plugin.CompressedInputParams(
+            kubeconfig=compressed, max_decompressed_size=128
+        )
+        result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("exceeds the limit of 128 bytes", data.error)
+
+    def test_compressed_invalid_data(self):
+        input = kubeconfig_plugin.CompressedInputParams(
+            kubeconfig=base64.b64encode(b"not gzip data").decode()
+        )
+        result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("Failed to decompress", data.error)
+
+    def test_compressed_invalid_input(self):
+        for kubeconfig, error in [
+            ("!!!!", "Failed to decode the compressed kubeconfig as base64"),
+            (
+                base64.b64encode(gzip.compress(b"kind: \xff\n")).decode(),
+                "The decompressed kubeconfig is not valid UTF-8",
+            ),
+            (
+                base64.b64encode(gzip.compress(b"")).decode(),
+                "The decompressed kubeconfig is empty.",
+            ),
+        ]:
+            input = kubeconfig_plugin.CompressedInputParams(kubeconfig=kubeconfig)
+            result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("error", result)
+            self.assertIn(error, data.error)
+
+    def write_service_account(self, directory, token, mtime):
+        token_path = os.path.join(directory, "token")
+        with open(token_path, "w") as f:
+            f.write(token)
+        os.utime(token_path, ns=(mtime, mtime))
+        with open(os.path.join(directory, "ca.crt"), "w") as f:
+            f.write(self.EXPECTED_TOKEN)
+
+    @mock.patch.dict(
+        os.environ,
+        {"KUBERNETES_SERVICE_HOST": "10.0.0.1", "KUBERNETES_SERVICE_PORT": "443"},
+    )
+    def test_in_cluster(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_service_account(directory, "token-1\n", 1_000_000_000)
+            input = kubeconfig_plugin.InClusterInputParams(
+                service_account_path=directory
+            )
+            result, data = kubeconfig_plugin.extract_in_cluster_config(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("success", result)
+            plugin.test_object_serialization(data)
+            conn = data.connection
+            self.assertEqual("https://10.0.0.1:443", conn.host)
+            self.assertEqual("token-1", conn.bearerToken)
+            self.assertEqual(self.EXPECTED_TOKEN, conn.cacert)
+
+            # Same mtime and size: the cached token is served.
+            self.write_service_account(directory, "token-2\n", 1_000_000_000)
+            result, data = kubeconfig_plugin.extract_in_cluster_config(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("token-1", data.connection.bearerToken)
+
+            # A rotated token changes the mtime and is picked up.
+            self.write_service_account(directory, "token-2\n", 2_000_000_000)
+            result, data = kubeconfig_plugin.extract_in_cluster_config(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("token-2", data.connection.bearerToken)
+
+    @mock.patch.dict(
+        os.environ,
+        {"KUBERNETES_SERVICE_HOST": "fd00::1", "KUBERNETES_SERVICE_PORT": "6443"},
+    )
+    def test_in_cluster_ipv6(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_service_account(directory, "token", 1_000_000_000)
+            input = kubeconfig_plugin.InClusterInputParams(
+                service_account_path=directory
+            )
+            result, data = kubeconfig_plugin.extract_in_cluster_config(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("success", result)
+            self.assertEqual("https://[fd00::1]:6443", data.connection.host)
+
+    @mock.patch.dict(os.environ, {}, clear=True)
+    def test_in_cluster_not_in_cluster(self):
+        input = kubeconfig_plugin.InClusterInputParams()
+        result, data = kubeconfig_plugin.extract_in_cluster_config(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("Not running inside a Kubernetes cluster", data.error)
+
+    @mock.patch.dict(
+        os.environ,
+        {"KUBERNETES_SERVICE_HOST": "10.0.0.1", "KUBERNETES_SERVICE_PORT": "443"},
+    )
+    def test_in_cluster_missing_token(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input = kubeconfig_plugin.InClusterInputParams(
+                service_account_path=directory
+            )
+            result, data = kubeconfig_plugin.extract_in_cluster_config(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("error", result)
+            self.assertIn("Failed to read the service account token", data.error)
+
+    def extract_verified(self, kubeconfig):
+        input = kubeconfig_plugin.InputParams(
+            kubeconfig=kubeconfig, verify_certificates=True
+        )
+        return kubeconfig_plugin.extract_kubeconfig(params=input, run_id="plugin_ci")
+
+    def test_verify_certificates(self):
+        for filename in [
+            "tests/test_client_cert.yaml",
+            "tests/test_client_cert_chain.yaml",
+        ]:
+            kubeconfig = self.get_kubeconfig_test_value(filename)
+            result, data = self.extract_verified(kubeconfig)
+            if result != "success":
+                print(f"{filename} failed. Error data: {data.error}", file=sys.stderr)
+            self.assertEqual("success", result)
+
+        # Token authentication has nothing to verify
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        result, data = self.extract_verified(kubeconfig)
+        self.assertEqual("success", result)
+
+    def test_verify_certificates_key_mismatch(self):
+        kubeconfig = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        )
+        other = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_client_cert.yaml")
+        )
+        kubeconfig["users"][0]["user"]["client-key-data"] = other["users"][0]["user"][
+            "client-key-data"
+        ]
+        result, data = self.extract_verified(yaml.safe_dump(kubeconfig))
+        self.assertEqual("error", result)
+        self.assertIn("client key does not match", data.error)
+
+    def test_verify_certificates_wrong_ca(self):
+        kubeconfig = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        )
+        other = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_client_cert.yaml")
+        )
+        kubeconfig["clusters"][0]["cluster"]["certificate-authority-data"] = other[
+            "clusters"
+        ][0]["cluster"]["certificate-authority-data"]
+        result, data = self.extract_verified(yaml.safe_dump(kubeconfig))
+        self.assertEqual("error", result)
+        self.assertIn("does not chain to the cluster CA", data.error)
+
+        # Without the intermediate certificate the chain is incomplete as well
+        kubeconfig = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        )
+        user = kubeconfig["users"][0]["user"]
+        leaf = kubeconfig_plugin.base64_decode(user["client-certificate-data"])
+        leaf = leaf[: leaf.index("-----END CERTIFICATE-----\n") + 26]
+        user["client-certificate-data"] = base64.b64encode(leaf.encode()).decode()
+        result, data = self.extract_verified(yaml.safe_dump(kubeconfig))
+        self.assertEqual("error", result)
+        self.assertIn("does not chain to the cluster CA", data.error)
+
+    def kubeconfig_with_credentials(self, cacert, cert, key):
+        kubeconfig = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        )
+        kubeconfig["clusters"][0]["cluster"]["certificate-authority-data"] = (
+            base64.b64encode(cacert).decode()
+        )
+        user = kubeconfig["users"][0]["user"]
+        user["client-certificate-data"] = base64.b64encode(cert).decode()
+        user["client-key-data"] = base64.b64encode(key).decode()
+        return yaml.safe_dump(kubeconfig)
+
+    def test_verify_certificates_ec(self):
+        ca_key = ec.generate_private_key(ec.SECP256R1())
+        ca = make_certificate("ec-ca", ca_key)
+        leaf_key = ec.generate_private_key(ec.SECP256R1())
+        leaf = make_certificate("ec-leaf", leaf_key, "ec-ca", ca_key)
+
+        result, data = self.extract_verified(
+            self.kubeconfig_with_credentials(ca, leaf, make_key_pem(leaf_key))
+        )
+        self.assertEqual("success", result)
+
+        other_key = ec.generate_private_key(ec.SECP256R1())
+        result, data = self.extract_verified(
+            self.kubeconfig_with_credentials(ca, leaf, make_key_pem(other_key))
+        )
+        self.assertEqual("error", result)
+        self.assertIn("client key does not match", data.error)
+
+        other_ca = make_certificate("ec-ca", other_key)
+        result, data = self.extract_verified(
+            self.kubeconfig_with_credentials(other_ca, leaf, make_key_pem(leaf_key))
+        )
+        self.assertEqual("error", result)
+        self.assertIn("does not chain to the cluster CA", data.error)
+
+        # A bundle mixing RSA and EC CAs is checked against each of them
+        rsa_ca = make_certificate("rsa-ca", rsa.generate_private_key(65537, 2048))
+        result, data = self.extract_verified(
+            self.kubeconfig_with_credentials(
+                rsa_ca + other_ca, leaf, make_key_pem(leaf_key)
+            )
+        )
+        self.assertEqual("error", result)
+        self.assertIn("does not chain to the cluster CA", data.error)
+        result, data = self.extract_verified(
+            self.kubeconfig_with_credentials(rsa_ca + ca, leaf, make_key_pem(leaf_key))
+        )
+        self.assertEqual("success", result)
+
+    def test_verify_certificates_pss(self):
+        ca_key = rsa.generate_private_key(65537, 2048)
+        ca = make_certificate("pss-ca", ca_key)
+        leaf_key = rsa.generate_private_key(65537, 2048)
+        leaf = make_certificate("pss-leaf", leaf_key, "pss-ca", ca_key, pss=True)
+        result, data = self.extract_verified(
+            self.kubeconfig_with_credentials(ca, leaf, make_key_pem(leaf_key))
+        )
+        if result != "success":
+            print(f"PSS test failed. Error data: {data.error}", file=sys.stderr)
+        self.assertEqual("success", result)
+
+    def test_verify_certificates_not_possible(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        with mock.patch.object(
+            kubeconfig_plugin,
+            "_signed_by",
+            side_effect=kubeconfig_plugin.VerificationNotPossible("unsupported"),
+        ):
+            kubeconfig_plugin._verification_cache.clear()
+            result, data = self.extract_verified(kubeconfig)
+        kubeconfig_plugin._verification_cache.clear()
+        self.assertEqual("error", result)
+        self.assertIn("Certificate verification is not possible", data.error)
+
+    def test_verify_certificates_cache(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        with mock.patch.object(
+            kubeconfig_plugin,
+            "_verify_client_certificate",
+            wraps=kubeconfig_plugin._verify_client_certificate,
+        ) as verify:
+            kubeconfig_plugin._verification_cache.clear()
+            self.assertEqual("success", self.extract_verified(kubeconfig)[0])
+            self.assertEqual("success", self.extract_verified(kubeconfig)[0])
+            self.assertEqual(1, verify.call_count)
+
+    def test_secrets_stream(self):
+        token = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        username = self.get_kubeconfig_test_value("tests/test_username.yaml")
+        client_cert = self.get_kubeconfig_test_value("tests/test_client_cert.yaml")
+        documents = [
+            {
+                "apiVersion": "v1",
+                "kind": "Secret",
+                "metadata": {"name": "token", "namespace": "fleet"},
+                "data": {"kubeconfig": base64.b64encode(token.encode()).decode()},
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "Secret",
+                "metadata": {"name": "unrelated"},
+                "data": {"password": "c2VjcmV0"},
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "metadata": {"name": "username"},
+                "data": {"kubeconfig": username},
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "List",
+                "items": [
+                    {
+                        "apiVersion": "v1",
+                        "kind": "Secret",
+                        "metadata": {"name": "client-cert"},
+                        "stringData": {"kubeconfig": client_cert},
+                    }
+                ],
+            },
+        ]
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets=yaml.safe_dump_all(documents)
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        if result != "success":
+            print(f"Functional test failed. Error data: {data.error}", file=sys.stderr)
+        self.assertEqual("success", result)
+        plugin.test_object_serialization(data)
+        self.assertEqual(
+            ["token", "username", "client-cert"],
+            [c.name for c in data.connections],
+        )
+        self.assertEqual("fleet", data.connections[0].namespace)
+        self.assertEqual(
+            "sha256~2Z70unz91xNLI43k7MnM_mTbIfwe1EVHuxEXDiFWM9c",
+            data.connections[0].connection.bearerToken,
+        )
+        self.assertEqual("admin", data.connections[1].connection.username)
+        self.assertEqual(self.EXPECTED_KEY, data.connections[2].connection.key)
+
+    def test_secrets_stream_invalid_kubeconfig(self):
+        documents = [
+            {
+                "kind": "Secret",
+                "metadata": {"name": "broken"},
+                "stringData": {"kubeconfig": "kind: NotConfig"},
+            }
+        ]
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets=yaml.safe_dump_all(documents)
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("Secret broken", data.error)
+        self.assertIn("not a kubeconfig file", data.error)
+
+    def test_secrets_stream_list_items_are_lazy(self):
+        # The second item is broken; the first one must be produced before the
+        # loader gets there.
+        stream = """apiVersion: v1
+items:
+- kind: Secret
+  metadata:
+    name: first
+- kind: Secret
+  metadata: [unterminated
+kind: List
+"""
+        objects = kubeconfig_plugin._iter_objects(
+            stream, kubeconfig_plugin.ParserLimits()
+        )
+        self.assertEqual("first", next(objects).value["metadata"]["name"])
+        with self.assertRaises(yaml.YAMLError):
+            next(objects)
+
+    def test_secrets_stream_items_of_other_kinds(self):
+        secret = {
+            "kind": "Secret",
+            "metadata": {"name": "nested"},
+            "stringData": {
+                "kubeconfig": self.get_kubeconfig_test_value("tests/test_token.yaml")
+            },
+        }
+        # Items of a mapping that is not a List are not objects of the stream,
+        # whether its kind comes before or after them.
+        for document in [
+            {"kind": "Pod", "items": [secret]},
+            {"items": [secret], "kind": "Pod"},
+        ]:
+            input = kubeconfig_plugin.SecretsInputParams(
+                secrets=yaml.safe_dump(document, sort_keys=False)
+            )
+            result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("error", result)
+            self.assertIn("No Secret or ConfigMap", data.error)
+
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets=yaml.safe_dump({"kind": "SecretList", "items": [secret]})
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        self.assertEqual(["nested"], [c.name for c in data.connections])
+
+    def test_secrets_stream_invalid_metadata(self):
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets="kind: Secret\nmetadata: foo\nstringData: {kubeconfig: x}\n"
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("'metadata' must be a mapping, got str", data.error)
+
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets="kind: Secret\nmetadata: {name: 5}\nstringData: {kubeconfig: x}\n"
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("'metadata.name' must be a string, got int", data.error)
+
+    def test_secrets_stream_no_kubeconfig(self):
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets="kind: Secret\nmetadata:\n  name: other\n---\nkind: Pod\n"
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("No Secret or ConfigMap", data.error)
+
+    def test_fingerprint(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_client_cert.yaml")
+        input = kubeconfig_plugin.InputParams(kubeconfig=kubeconfig)
+        result, data = kubeconfig_plugin.extract_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        plugin.test_object_serialization(data)
+        fingerprint = data.fingerprint
+        self.assertEqual(64, len(fingerprint.sha256))
+        self.assertEqual(["cacert", "cert", "host", "key"], list(fingerprint.fields))
+
+        # The same credentials in a differently laid out kubeconfig produce the
+        # same fingerprint.
+        reordered = yaml.safe_dump(yaml.safe_load(kubeconfig), sort_keys=True)
+        input = kubeconfig_plugin.InputParams(kubeconfig=reordered)
+        result, data = kubeconfig_plugin.extract_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual(fingerprint, data.fingerprint)
+
+        # Changing one field changes the overall digest and only that field hash.
+        changed = kubeconfig.replace("api.nonexistent", "api2.nonexistent")
+        input = kubeconfig_plugin.InputParams(kubeconfig=changed)
+        result, data = kubeconfig_plugin.extract_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertNotEqual(fingerprint.sha256, data.fingerprint.sha256)
+        self.assertNotEqual(fingerprint.fields["host"], data.fingerprint.fields["host"])
+        self.assertEqual(fingerprint.fields["cert"], data.fingerprint.fields["cert"])
+
+    def extract_bounded(self, kubeconfig, **limits):
+        input = kubeconfig_plugin.InputParams(
+            kubeconfig=kubeconfig, limits=kubeconfig_plugin.ParserLimits(**limits)
+        )
+        return kubeconfig_plugin.extract_kubeconfig(params=input, run_id="plugin_ci")
+
+    def test_bounded_loading(self):
+        for filename in [
+            "tests/test_token.yaml",
+            "tests/test_client_cert.yaml",
+            "tests/test_username.yaml",
+        ]:
+            kubeconfig = self.get_kubeconfig_test_value(filename)
+            result, data = self.extract_bounded(kubeconfig)
+            self.assertEqual("success", result)
+            input = kubeconfig_plugin.InputParams(kubeconfig=kubeconfig)
+            self.assertEqual(
+                kubeconfig_plugin.extract_kubeconfig(params=input, run_id="plugin_ci"),
+                (result, data),
+            )
+
+    @staticmethod
+    def alias_bomb(levels=9):
+        lines = ['a: &a ["lol","lol","lol","lol","lol","lol","lol","lol","lol"]']
+        for i in range(1, levels):
+            previous = chr(ord("a") + i - 1)
+            current = chr(ord("a") + i)
+            lines.append(f"{current}: &{current} [{', '.join(['*' + previous] * 9)}]")
+        return "\n".join(lines)
+
+    def test_bounded_loading_alias_bomb(self):
+        lines = self.alias_bomb().split("\n")
+        result, data = self.extract_bounded("\n".join(lines))
+        self.assertEqual("error", result)
+        self.assertIn("Refusing to load kubeconfig", data.error)
+        self.assertIn("YAML aliases expand to more than 10000 nodes", data.error)
+
+        result, data = self.extract_bounded("\n".join(lines), max_aliases=5)
+        self.assertEqual("error", result)
+        self.assertIn("more than 5 YAML aliases", data.error)
+
+    def test_bounded_loading_other_steps(self):
+        # The compressed and secrets steps are always bounded.
+        bomb = self.alias_bomb(8) + "\ncurrent-context: *g\n"
+        input = kubeconfig_plugin.CompressedInputParams(
+            kubeconfig=base64.b64encode(gzip.compress(bomb.encode())).decode()
+        )
+        result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("YAML aliases expand to more than 10000 nodes", data.error)
+
+        input = kubeconfig_plugin.CompressedInputParams(
+            kubeconfig=base64.b64encode(gzip.compress(bomb.encode())).decode(),
+            limits=kubeconfig_plugin.ParserLimits(max_aliases=5),
+        )
+        result, data = kubeconfig_plugin.extract_compressed_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("more than 5 YAML aliases", data.error)
+
+        # A bomb in the stream itself, and one in an embedded kubeconfig
+        for secrets in [
+            "kind: Secret\nmetadata:\n  " + bomb.replace("\n", "\n  "),
+            yaml.safe_dump(
+                {
+                    "kind": "Secret",
+                    "metadata": {"name": "bomb"},
+                    "stringData": {"kubeconfig": bomb},
+                }
+            ),
+        ]:
+            input = kubeconfig_plugin.SecretsInputParams(secrets=secrets)
+            result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("error", result)
+            self.assertIn("Refusing to load", data.error)
+            self.assertIn("YAML aliases expand to more than 10000 nodes", data.error)
+
+    def test_bounded_loading_list_items(self):
+        # The node limit applies to each item of a List, not to the List.
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        items = [
+            {
+                "kind": "Secret",
+                "metadata": {"name": f"secret-{i}"},
+                "stringData": {"kubeconfig": kubeconfig},
+            }
+            for i in range(200)
+        ]
+        input = kubeconfig_plugin.SecretsInputParams(
+            secrets=yaml.safe_dump({"kind": "SecretList", "items": items}),
+            limits=kubeconfig_plugin.ParserLimits(max_nodes=100),
+        )
+        result, data = kubeconfig_plugin.extract_secrets_kubeconfigs(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        self.assertEqual(200, len(data.connections))
+
+    def test_bounded_loading_limits(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        result, data = self.extract_bounded(kubeconfig, max_input_size=100)
+        self.assertEqual("error", result)
+        self.assertIn("longer than 100 characters", data.error)
+
+        result, data = self.extract_bounded(kubeconfig, max_nodes=10)
+        self.assertEqual("error", result)
+        self.assertIn("more than 10 YAML nodes", data.error)
+
+        result, data = self.extract_bounded("[" * 100 + "]" * 100)
+        self.assertEqual("error", result)
+        self.assertIn("nesting deeper than 64 levels", data.error)
+
+    def lint(self, kubeconfig):
+        input = kubeconfig_plugin.LintInputParams(kubeconfig=kubeconfig)
+        result, data = kubeconfig_plugin.lint_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        plugin.test_object_serialization(data)
+        return data
+
+    def test_lint_valid(self):
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_client_cert_chain.yaml")
+        data = self.lint(kubeconfig)
+        self.assertTrue(data.valid)
+        self.assertEqual([], data.problems)
+
+        # The second context refers to a user that does not exist
+        kubeconfig = self.get_kubeconfig_test_value("tests/test_token.yaml")
+        data = self.lint(kubeconfig)
+        self.assertTrue(data.valid)
+        self.assertEqual(1, len(data.problems))
+        self.assertEqual(kubeconfig_plugin.Severity.WARNING, data.problems[0].severity)
+        self.assertEqual("$.contexts[1].context.user", data.problems[0].path)
+        self.assertEqual(15, data.problems[0].line)
+
+    def test_lint_reports_all_problems(self):
+        kubeconfig = """apiVersion: v1
+kind: Config
+current-context: missing
+clusters:
+- name: a
+  cluster:
+    server: https://a
+    certificate-authority-data: abc
+- name: a
+  cluster: {certificate-authority-data: "!!!"}
+users:
+- name: u
+  user:
+    client-certificate-data: QUJD
+contexts:
+- name: c
+  context:
+    cluster: nope
+    user: u
+- context: {}
+"""
+        data = self.lint(kubeconfig)
+        self.assertFalse(data.valid)
+        problems = [(p.path, p.line, p.message) for p in data.problems]
+        self.assertEqual(
+            [
+                ("$.current-context", 3, "no context named 'missing'"),
+                (
+                    "$.clusters[0].cluster.certificate-authority-data",
+                    8,
+                    "'certificate-authority-data' is not valid base64 data",
+                ),
+                (
+                    "$.clusters[1].name",
+                    9,
+                    "duplicate cluster name 'a', first defined on line 5; the last"
+                    " definition is used",
+                ),
+                ("$.clusters[1].cluster", 10, "'server' field missing"),
+                (
+                    "$.clusters[1].cluster.certificate-authority-data",
+                    10,
+                    "'certificate-authority-data' is not valid base64 data",
+                ),
+                ("$.clusters[1].cluster", 10, "cluster 'a' is not used by any context"),
+                (
+                    "$.users[0].user",
+                    14,
+                    "'client-certificate-data' and 'client-key-data' must be set"
+                    " together",
+                ),
+                (
+                    "$.contexts[0].context.cluster",
+                    18,
+                    "context refers to undefined cluster 'nope'",
+                ),
+                ("$.contexts[1]", 20, "'name' field missing"),
+            ],
+            problems,
+        )
+
+    def test_lint_malformed_values(self):
+        kubeconfig = """apiVersion: v1
+kind: Config
+current-context: [c]
+clusters:
+- name: a
+  cluster: 5
+users:
+- name: u
+  user:
+    client-certificate-data: {x: 1}
+    client-key-data: QUJD
+contexts:
+- name: c
+  context:
+    cluster: a
+    user: u
+    ? [x]
+    : 1
+"""
+        data = self.lint(kubeconfig)
+        self.assertFalse(data.valid)
+        problems = [(p.path, p.line, p.message) for p in data.problems]
+        self.assertEqual(
+            [
+                ("$.current-context", 3, "'current-context' must be a string"),
+                ("$.clusters[0].cluster", 6, "expected a mapping"),
+                (
+                    "$.users[0].user.client-certificate-data",
+                    10,
+                    "'client-certificate-data' must be a string",
+                ),
+                ("$.contexts[0].context", 17, "mapping keys must be strings"),
+            ],
+            problems,
+        )
+
+    def test_lint_not_a_kubeconfig(self):
+        data = self.lint("- a\n- b\n")
+        self.assertFalse(data.valid)
+        self.assertEqual("expected a mapping", data.problems[0].message)
+
+        data = self.lint("kind: NotConfig\n")
+        self.assertFalse(data.valid)
+        messages = [p.message for p in data.problems]
+        self.assertIn("kind must be 'Config'", messages)
+        self.assertIn("'clusters' section missing", messages)
+        self.assertIn("'users' section missing", messages)
+        self.assertIn("'contexts' section missing", messages)
+        self.assertIn("'current-context' field missing", messages)
+
+        input = kubeconfig_plugin.LintInputParams(kubeconfig="\tyaml-can't-have-tabs")
+        result, data = kubeconfig_plugin.lint_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("not valid YAML", data.error)
+
+    def oidc_kubeconfig(self, **config):
+        kubeconfig = yaml.safe_load(
+            self.get_kubeconfig_test_value("tests/test_token.yaml")
+        )
+        kubeconfig["users"][0]["user"] = {
+            "auth-provider": {"name": "oidc", "config": config}
+        }
+        return yaml.safe_dump(kubeconfig)
+
+    def test_oidc_valid_id_token(self):
+        id_token = make_jwt({"sub": "admin", "exp": int(time.time()) + 3600})
+        kubeconfig = self.oidc_kubeconfig(
+            **{
+                "id-token": id_token,
+                "idp-issuer-url": "http://127.0.0.1:1",
+                "client-id": "kubernetes",
+                "refresh-token": "refresh",
+            }
+        )
+        input = kubeconfig_plugin.InputParams(kubeconfig=kubeconfig)
+        result, data = kubeconfig_plugin.extract_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("success", result)
+        self.assertEqual(id_token, data.connection.bearerToken)
+
+        # OIDC users are not flagged as lacking supported credentials
+        data = self.lint(kubeconfig)
+        self.assertEqual(
+            ["$.contexts[1].context.user"], [p.path for p in data.problems]
+        )
+
+    def test_oidc_refresh(self):
+        with StandInIdP() as idp:
+            kubeconfig = self.oidc_kubeconfig(
+                **{
+                    "id-token": make_jwt({"sub": "admin", "exp": 1}),
+                    "idp-issuer-url": idp.issuer,
+                    "client-id": "kubernetes",
+                    "client-secret": "secret",
+                    "refresh-token": "refresh-test-oidc-refresh",
+                }
+            )
+            input = kubeconfig_plugin.InputParams(kubeconfig=kubeconfig)
+            result, data = kubeconfig_plugin.extract_kubeconfig(
+                params=input, run_id="plugin_ci"
+            )
+            if result != "success":
+                print(f"OIDC test failed. Error data: {data.error}", file=sys.stderr)
+            self.assertEqual("success", result)
+            token = data.connection.bearerToken
+            self.assertEqual(
+                "refresh-test-oidc-refresh",
+                json.loads(base64.urlsafe_b64decode(token.split(".")[1] + "=="))["sub"],
+            )
+
+            # The refreshed token is served from the cache
+            result, data = kubeconfig_plugin.extract_kubeconfig(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual(token, data.connection.bearerToken)
+            self.assertEqual(1, idp.token_requests)
+
+    def test_oidc_refresh_token_rotation(self):
+        with StandInIdP() as idp:
+            idp.rotate = True
+            # Issued tokens are already inside the expiry skew, so every call
+            # refreshes again.
+            idp.lifetime = 0
+            config = {
+                "idp-issuer-url": idp.issuer,
+                "client-id": "kubernetes",
+                "refresh-token": "refresh-test-oidc-rotation",
+            }
+            subjects = []
+            for _ in range(3):
+                token = kubeconfig_plugin.oidc_token(config)
+                subjects.append(
+                    json.loads(base64.urlsafe_b64decode(token.split(".")[1] + "=="))[
+                        "sub"
+                    ]
+                )
+            self.assertEqual(
+                [
+                    "refresh-test-oidc-rotation",
+                    "refresh-test-oidc-rotation-1",
+                    "refresh-test-oidc-rotation-1-2",
+                ],
+                subjects,
+            )
+            self.assertEqual(3, idp.token_requests)
+
+    def test_oidc_cache_pruning(self):
+        with StandInIdP() as idp:
+            idp.lifetime = 0
+            keys = []
+            for user in ["first", "second"]:
+                config = {
+                    "idp-issuer-url": idp.issuer,
+                    "client-id": "kubernetes",
+                    "refresh-token": f"refresh-test-oidc-pruning-{user}",
+                }
+                kubeconfig_plugin.oidc_token(config)
+                keys.append(
+                    (
+                        idp.issuer,
+                        "kubernetes",
+                        hashlib.sha256(config["refresh-token"].encode()).hexdigest(),
+                    )
+                )
+            # Storing the second token dropped the expired first one, and no
+            # refresh lock outlives its refresh.
+            self.assertNotIn(keys[0], kubeconfig_plugin._oidc_token_cache)
+            self.assertIn(keys[1], kubeconfig_plugin._oidc_token_cache)
+            for key in keys:
+                self.assertNotIn(key, kubeconfig_plugin._oidc_refresh_locks)
+
+    def test_oidc_concurrent_refresh(self):
+        config = {
+            "idp-issuer-url": None,
+            "client-id": "kubernetes",
+            "refresh-token": "refresh-test-oidc-concurrent-refresh",
+        }
+        with StandInIdP() as idp:
+            idp.delay = 0.2
+            config["idp-issuer-url"] = idp.issuer
+            tokens = []
+
+            def get_token():
+                tokens.append(kubeconfig_plugin.oidc_token(config))
+
+            threads = [threading.Thread(target=get_token) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(8, len(tokens))
+            self.assertEqual(1, len(set(tokens)))
+            self.assertEqual(1, idp.token_requests)
+
+    def test_oidc_refresh_failure(self):
+        with StandInIdP() as idp:
+            idp.status = 400
+            kubeconfig = self.oidc_kubeconfig(
+                **{
+                    "idp-issuer-url": idp.issuer,
+                    "client-id": "kubernetes",
+                    "refresh-token": "refresh-test-oidc-refresh-failure",
+                }
+            )
+            input = kubeconfig_plugin.InputParams(kubeconfig=kubeconfig)
+            result, data = kubeconfig_plugin.extract_kubeconfig(
+                params=input, run_id="plugin_ci"
+            )
+            self.assertEqual("error", result)
+            self.assertIn("Failed to get an OIDC token for user admin", data.error)
+            self.assertIn("HTTP 400", data.error)
+
+        kubeconfig = self.oidc_kubeconfig(**{"client-id": "kubernetes"})
+        input = kubeconfig_plugin.InputParams(kubeconfig=kubeconfig)
+        result, data = kubeconfig_plugin.extract_kubeconfig(
+            params=input, run_id="plugin_ci"
+        )
+        self.assertEqual("error", result)
+        self.assertIn("'idp-issuer-url' is not set", data.error)
+
 
 if __name__ == "__main__":
     unittest.main()